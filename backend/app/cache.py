@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable
+
+from cachetools import TTLCache
+
+
+class VersionedTTLCache:
+    """
+    进程内 TTL 缓存（多 worker 时最多陈旧 ttl 秒）：
+    - 读未命中时在锁外加载，回填前核对代数：加载期间有写入方失效/写穿，就不回填，避免把旧行塞回缓存
+    - 写入方在提交后调用 invalidate() 或直接 put() 新值
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache: TTLCache[str, Any] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get_or_load(self, key: str, loader: Callable[[str], Any]) -> Any:
+        with self._lock:
+            try:
+                return self._cache[key]
+            except KeyError:
+                generation = self._generation
+        value = loader(key)
+        with self._lock:
+            if self._generation == generation:
+                self._cache[key] = value
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache[key] = value
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache.pop(key, None)
+
+
+# 热路径上的 SQLite 读
+session_cache = VersionedTTLCache(maxsize=4096, ttl=30)
+
+
+def invalidate_session(session_id: str) -> None:
+    session_cache.invalidate(session_id)
+
+
+# plan 连同 node_index / max_order 一起缓存，submit 查节点 O(1)；写入方直接 put 新条目
+plan_cache = VersionedTTLCache(maxsize=1024, ttl=30)
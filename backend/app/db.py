@@ -1,15 +1,19 @@
 from __future__ import annotations
 
-import json
 import os
+import queue
 import sqlite3
+import threading
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Iterator
 
-from .settings import settings
+import orjson
+
+from .cache import invalidate_session, plan_cache, session_cache
+from .settings import get_settings
 
 
 def _utcnow() -> datetime:
@@ -27,14 +31,56 @@ def _parse_iso(s: str) -> datetime:
     return datetime.fromisoformat(s)
 
 
-def ensure_db() -> None:
-    db_path = Path(settings.sqlite_path)
-    if not db_path.is_absolute():
-        # 以 backend 目录为根（uvicorn working dir 可能变化）
-        db_path = Path(__file__).resolve().parent.parent / db_path
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+_READER_POOL_SIZE = 4
+
+# 每个连接创建时执行一次；journal_mode 是库级持久设置，只需写连接执行
+_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-65536;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA busy_timeout=30000;",
+)
+
+_DB_PATH: str | None = None
+_DB_READY = False
+
+_init_lock = threading.Lock()
+_write_lock = threading.Lock()
+_writer_conn: sqlite3.Connection | None = None
+_reader_pool: queue.Queue[sqlite3.Connection] | None = None
+
+_cfg_lock = threading.Lock()
+_cfg_cache: dict[str, Any] | None = None
+
+
+def _dict_factory(cur: sqlite3.Cursor, row: tuple[Any, ...]) -> dict[str, Any]:
+    return {d[0]: v for d, v in zip(cur.description, row)}
+
 
-    with sqlite3.connect(str(db_path)) as conn:
+def _open(uri: str, *, autocommit: bool = False) -> sqlite3.Connection:
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None if autocommit else "")
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def init_db() -> None:
+    """建表并创建连接池；启动时调用一次，之后再调用直接返回。"""
+
+    global _writer_conn, _reader_pool, _DB_READY
+    if _DB_READY:
+        return
+    with _init_lock:
+        if _DB_READY:
+            return
+
+        db_path = Path(_db_path_str())
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        uri = db_path.as_uri()
+
+        # 写连接用 autocommit，多语句写入显式走 transaction()
+        conn = _open(uri, autocommit=True)
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute(
             """
@@ -100,44 +146,134 @@ def ensure_db() -> None:
             );
             """
         )
-        conn.commit()
+        # list_sessions 只读这些列：索引覆盖查询，免回表
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_user_updated "
+            "ON sessions(user_id, updated_at DESC, session_id, title, created_at);"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_session ON questions(session_id, created_at);")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_attempts_session_order ON node_attempts(session_id, node_order, created_at);"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attempts_user ON node_attempts(user_id, created_at DESC);")
+
+        # 表建好后再开只读连接（WAL 下读写互不阻塞）
+        pool: queue.Queue[sqlite3.Connection] = queue.Queue()
+        for _ in range(_READER_POOL_SIZE):
+            pool.put(_open(f"{uri}?mode=ro"))
+
+        _writer_conn = conn
+        _reader_pool = pool
+        _DB_READY = True
+
+
+def close_db() -> None:
+    global _writer_conn, _reader_pool, _DB_READY, _DB_PATH
+    with _init_lock:
+        _DB_READY = False
+        # 下次 init_db 重新从 get_settings() 解析路径
+        _DB_PATH = None
+        # 先摘下池再关连接，仍在借用的读连接归还时由 read_conn 关闭
+        pool, _reader_pool = _reader_pool, None
+        if pool is not None:
+            _drain_pool(pool)
+        if _writer_conn is not None:
+            with _write_lock:
+                _writer_conn.close()
+            _writer_conn = None
+
+
+def _drain_pool(pool: queue.Queue[sqlite3.Connection]) -> None:
+    while True:
+        try:
+            pool.get_nowait().close()
+        except queue.Empty:
+            return
 
 
 def _db_path_str() -> str:
-    db_path = Path(settings.sqlite_path)
-    if not db_path.is_absolute():
-        db_path = Path(__file__).resolve().parent.parent / db_path
-    return str(db_path)
+    global _DB_PATH
+    if _DB_PATH is None:
+        db_path = Path(get_settings().sqlite_path)
+        if not db_path.is_absolute():
+            # 以 backend 目录为根（uvicorn working dir 可能变化）
+            db_path = Path(__file__).resolve().parent.parent / db_path
+        _DB_PATH = str(db_path)
+    return _DB_PATH
 
 
 @contextmanager
-def connect() -> Iterator[sqlite3.Connection]:
-    ensure_db()
-    conn = sqlite3.connect(_db_path_str())
-    conn.row_factory = sqlite3.Row
+def read_conn() -> Iterator[sqlite3.Connection]:
+    if not _DB_READY:
+        init_db()
+    pool = _reader_pool
+    assert pool is not None
+    conn = pool.get()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.put(conn)
+        if pool is not _reader_pool:
+            # 借出期间 close_db 已换下这个池：归还后自己把剩下的连接关掉
+            _drain_pool(pool)
+
+
+@contextmanager
+def write_conn() -> Iterator[sqlite3.Connection]:
+    if not _DB_READY:
+        init_db()
+    assert _writer_conn is not None
+    with _write_lock:
+        yield _writer_conn
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """一次 BEGIN IMMEDIATE ... COMMIT 内完成多条写入，只落一次盘。"""
+
+    with write_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
 
 
 def get_llm_config() -> dict[str, Any]:
-    with connect() as conn:
-        row = conn.execute("SELECT * FROM llm_config WHERE id = 1").fetchone()
+    # 配置只在 /config/llm 保存时变化：进程内缓存，upsert_llm_config 时失效
+    global _cfg_cache
+    cfg = _cfg_cache
+    if cfg is None:
+        with _cfg_lock:
+            if _cfg_cache is None:
+                _cfg_cache = _load_llm_config()
+            cfg = _cfg_cache
+    return dict(cfg)
+
+
+def _load_llm_config() -> dict[str, Any]:
+    with read_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = _dict_factory
+        row = cur.execute("SELECT * FROM llm_config WHERE id = 1").fetchone()
         if row is None:
             # 默认值来自 settings（也支持用环境变量启动）
+            s = get_settings()
             return {
-                "base_url": settings.llm_base_url,
-                "api_key": settings.llm_api_key,
-                "model": settings.llm_model,
-                "temperature": settings.llm_temperature,
+                "base_url": s.llm_base_url,
+                "api_key": s.llm_api_key,
+                "model": s.llm_model,
+                "temperature": s.llm_temperature,
                 "updated_at": _iso(_utcnow()),
             }
-        return dict(row)
+        return row
 
 
 def upsert_llm_config(base_url: str, api_key: str, model: str, temperature: float) -> None:
-    with connect() as conn:
+    global _cfg_cache
+    with _cfg_lock, write_conn() as conn:
         conn.execute(
             """
             INSERT INTO llm_config (id, base_url, api_key, model, temperature, updated_at)
@@ -151,17 +287,17 @@ def upsert_llm_config(base_url: str, api_key: str, model: str, temperature: floa
             """,
             (base_url, api_key, model, temperature, _iso(_utcnow())),
         )
-        conn.commit()
+        _cfg_cache = None
 
 
 def create_session(session_id: str, user_id: str, title: str) -> dict[str, Any]:
     now = _iso(_utcnow())
-    with connect() as conn:
+    with write_conn() as conn:
         conn.execute(
             "INSERT INTO sessions(session_id, user_id, title, created_at, updated_at, unlocked_order) VALUES(?,?,?,?,?,0)",
             (session_id, user_id, title, now, now),
         )
-        conn.commit()
+        invalidate_session(session_id)
         return {
             "session_id": session_id,
             "user_id": user_id,
@@ -173,46 +309,73 @@ def create_session(session_id: str, user_id: str, title: str) -> dict[str, Any]:
 
 
 def list_sessions(user_id: str) -> list[dict[str, Any]]:
-    with connect() as conn:
+    with read_conn() as conn:
         rows = conn.execute(
             "SELECT session_id, title, created_at, updated_at FROM sessions WHERE user_id = ? ORDER BY updated_at DESC",
             (user_id,),
         ).fetchall()
-        return [dict(r) for r in rows]
+        return [{"session_id": r[0], "title": r[1], "created_at": r[2], "updated_at": r[3]} for r in rows]
 
 
 def get_session(session_id: str) -> dict[str, Any] | None:
-    with connect() as conn:
-        row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
-        return dict(row) if row else None
+    return session_cache.get_or_load(session_id, _load_session)
+
+
+def _load_session(session_id: str) -> dict[str, Any] | None:
+    with read_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = _dict_factory
+        return cur.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
 
 
 def bump_session_updated(session_id: str) -> None:
-    with connect() as conn:
+    with write_conn() as conn:
         conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (_iso(_utcnow()), session_id))
-        conn.commit()
+        invalidate_session(session_id)
 
 
 def set_unlocked_order(session_id: str, unlocked_order: int) -> None:
-    with connect() as conn:
+    with write_conn() as conn:
         conn.execute(
             "UPDATE sessions SET unlocked_order = ?, updated_at = ? WHERE session_id = ?",
             (unlocked_order, _iso(_utcnow()), session_id),
         )
-        conn.commit()
+        invalidate_session(session_id)
+
+
+def advance_unlocked_order(session_id: str, unlocked_order: int) -> int:
+    """只前进不回退；RETURNING 把写后的值一并带回，省掉一次重读。"""
+
+    with write_conn() as conn:
+        rows = conn.execute(
+            "UPDATE sessions SET unlocked_order = MAX(unlocked_order, ?), updated_at = ? WHERE session_id = ? "
+            "RETURNING unlocked_order",
+            (unlocked_order, _iso(_utcnow()), session_id),
+        ).fetchall()
+        invalidate_session(session_id)
+    return int(rows[0][0]) if rows else unlocked_order
 
 
 def insert_question(question_id: str, session_id: str, question: str, topic_hint: str | None) -> dict[str, Any]:
+    return insert_questions_many(
+        [{"question_id": question_id, "session_id": session_id, "question": question, "topic_hint": topic_hint}]
+    )[0]
+
+
+def insert_questions_many(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
     now = _iso(_utcnow())
-    with connect() as conn:
-        conn.execute(
+    with transaction() as conn:
+        conn.executemany(
             "INSERT INTO questions(question_id, session_id, question, topic_hint, created_at) VALUES(?,?,?,?,?)",
-            (question_id, session_id, question, topic_hint, now),
+            [(r["question_id"], r["session_id"], r["question"], r.get("topic_hint"), now) for r in rows],
         )
-        conn.execute("UPDATE sessions SET title=?, updated_at=? WHERE session_id=?",
-                     (_make_title(question), now, session_id))
-        conn.commit()
-    return {"question_id": question_id, "created_at": now}
+        conn.executemany(
+            "UPDATE sessions SET title=?, updated_at=? WHERE session_id=?",
+            [(_make_title(r["question"]), now, r["session_id"]) for r in rows],
+        )
+    for r in rows:
+        invalidate_session(r["session_id"])
+    return [{"question_id": r["question_id"], "created_at": now} for r in rows]
 
 
 def _make_title(q: str) -> str:
@@ -220,29 +383,74 @@ def _make_title(q: str) -> str:
     return q[:28] + ("…" if len(q) > 28 else "")
 
 
+_UPSERT_PLAN_SQL = """
+INSERT INTO plans(session_id, outline, nodes_json, created_at)
+VALUES(?,?,?,?)
+ON CONFLICT(session_id) DO UPDATE SET
+  outline=excluded.outline,
+  nodes_json=excluded.nodes_json,
+  created_at=excluded.created_at;
+"""
+
+
 def upsert_plan(session_id: str, outline: str, nodes: list[dict[str, Any]]) -> None:
     now = _iso(_utcnow())
-    with connect() as conn:
+    nodes_json = orjson.dumps(nodes).decode()
+    with write_conn() as conn:
+        conn.execute(_UPSERT_PLAN_SQL, (session_id, outline, nodes_json, now))
+        plan_cache.put(session_id, _plan_entry(outline, nodes_json, now))
+
+
+def write_ask_result(
+    session_id: str,
+    question_id: str,
+    question: str,
+    topic_hint: str | None,
+    outline: str,
+    nodes: list[dict[str, Any]],
+    unlocked_order: int,
+) -> dict[str, Any]:
+    """/ask 的全部写入（问题、plan、会话标题与解锁进度）放进一个事务。"""
+
+    now = _iso(_utcnow())
+    nodes_json = orjson.dumps(nodes).decode()
+    with transaction() as conn:
         conn.execute(
-            """
-            INSERT INTO plans(session_id, outline, nodes_json, created_at)
-            VALUES(?,?,?,?)
-            ON CONFLICT(session_id) DO UPDATE SET
-              outline=excluded.outline,
-              nodes_json=excluded.nodes_json,
-              created_at=excluded.created_at;
-            """,
-            (session_id, outline, json.dumps(nodes, ensure_ascii=False), now),
+            "INSERT INTO questions(question_id, session_id, question, topic_hint, created_at) VALUES(?,?,?,?,?)",
+            (question_id, session_id, question, topic_hint, now),
         )
-        conn.commit()
+        conn.execute(_UPSERT_PLAN_SQL, (session_id, outline, nodes_json, now))
+        conn.execute(
+            "UPDATE sessions SET title=?, unlocked_order=?, updated_at=? WHERE session_id=?",
+            (_make_title(question), unlocked_order, now, session_id),
+        )
+    invalidate_session(session_id)
+    # 写穿：刚提交的 plan 直接进缓存，紧随其后的 submit 不必回读
+    plan_cache.put(session_id, _plan_entry(outline, nodes_json, now))
+    return {"created_at": now, "unlocked_order": unlocked_order}
+
+
+def _plan_entry(outline: str, nodes_json: str, created_at: str) -> dict[str, Any]:
+    nodes = orjson.loads(nodes_json)
+    return {
+        "outline": outline,
+        "nodes": nodes,
+        "created_at": created_at,
+        "node_index": {str(n.get("node_id")): n for n in nodes},
+        "max_order": max((int(n.get("order") or 0) for n in nodes), default=0),
+    }
 
 
 def get_plan(session_id: str) -> dict[str, Any] | None:
-    with connect() as conn:
+    return plan_cache.get_or_load(session_id, _load_plan)
+
+
+def _load_plan(session_id: str) -> dict[str, Any] | None:
+    with read_conn() as conn:
         row = conn.execute("SELECT outline, nodes_json, created_at FROM plans WHERE session_id = ?", (session_id,)).fetchone()
-        if not row:
-            return None
-        return {"outline": row["outline"], "nodes": json.loads(row["nodes_json"]), "created_at": row["created_at"]}
+    if not row:
+        return None
+    return _plan_entry(row[0], row[1], row[2])
 
 
 def insert_attempt(
@@ -256,14 +464,44 @@ def insert_attempt(
     passed: bool,
     feedback: str,
 ) -> None:
+    insert_attempts_many(
+        [
+            {
+                "attempt_id": attempt_id,
+                "session_id": session_id,
+                "user_id": user_id,
+                "node_id": node_id,
+                "node_order": node_order,
+                "answer": answer,
+                "score": score,
+                "passed": passed,
+                "feedback": feedback,
+            }
+        ]
+    )
+
+
+def insert_attempts_many(rows: list[dict[str, Any]]) -> None:
     now = _iso(_utcnow())
-    with connect() as conn:
-        conn.execute(
+    with transaction() as conn:
+        conn.executemany(
             """
             INSERT INTO node_attempts(attempt_id, session_id, user_id, node_id, node_order, answer, score, passed, feedback, created_at)
             VALUES(?,?,?,?,?,?,?,?,?,?)
             """,
-            (attempt_id, session_id, user_id, node_id, node_order, answer, score, 1 if passed else 0, feedback, now),
+            [
+                (
+                    r["attempt_id"],
+                    r["session_id"],
+                    r["user_id"],
+                    r["node_id"],
+                    r["node_order"],
+                    r["answer"],
+                    r["score"],
+                    1 if r["passed"] else 0,
+                    r["feedback"],
+                    now,
+                )
+                for r in rows
+            ],
         )
-        conn.commit()
-
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import uuid
 from typing import Any
 
 from .llm import LLMError, chat_json
@@ -17,6 +16,8 @@ GRADE_SCHEMA_HINT = """
 }
 """.strip()
 
+_GRADE_SYS = {"role": "system", "content": "你是严格输出 JSON 的批改老师。"}
+
 
 def _grade_messages(title: str, knowledge_goal: str, practice_task: str, rubric: list[str], pass_score: int, answer: str) -> list[dict[str, str]]:
     prompt = f"""
@@ -38,10 +39,7 @@ def _grade_messages(title: str, knowledge_goal: str, practice_task: str, rubric:
 - passed 必须与 score >= pass_score 保持一致
 - feedback 要指出：是否满足“可验证”要求（输出/耗时/顺序/正确性），是否正确使用关键 API，缺失点是什么
 """.strip()
-    return [
-        {"role": "system", "content": "你是严格输出 JSON 的批改老师。"},
-        {"role": "user", "content": prompt},
-    ]
+    return [_GRADE_SYS, {"role": "user", "content": prompt}]
 
 
 async def grade_answer(
@@ -56,15 +54,16 @@ async def grade_answer(
     try:
         data = await chat_json(_grade_messages(title, knowledge_goal, practice_task, rubric, pass_score, answer), GRADE_SCHEMA_HINT)
         score = int(data.get("score", 0))
-        passed = bool(data.get("passed", False))
-        # 强制一致
-        passed = bool(score >= int(pass_score))
+        # passed 以 score 为准（忽略模型给的 passed，强制一致）
+        passed = score >= int(pass_score)
+        strengths = data.get("strengths")
+        improvements = data.get("improvements")
         return {
             "score": score,
             "passed": passed,
             "feedback": str(data.get("feedback", "")),
-            "strengths": list(data.get("strengths") or []),
-            "improvements": list(data.get("improvements") or []),
+            "strengths": strengths if isinstance(strengths, list) else [],
+            "improvements": improvements if isinstance(improvements, list) else [],
         }
     except LLMError:
         return mock_grade(int(pass_score), answer)
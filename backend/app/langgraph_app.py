@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 import uuid
 from typing import Any, TypedDict
 
@@ -35,6 +36,8 @@ PLAN_SCHEMA_HINT = """
 }
 """.strip()
 
+_COACH_SYS = {"role": "system", "content": "你是严格遵循结构化输出的编程教练。"}
+
 
 def _build_messages(topic: str | None, question: str) -> list[dict[str, str]]:
     coach_prompt = f"""
@@ -53,10 +56,7 @@ def _build_messages(topic: str | None, question: str) -> list[dict[str, str]]:
 - hint_code 要用到与该知识点相关的关键 API/语法，但不要与 practice_task 同构（不要同变量/同流程/同输出）
     """.strip()
 
-    return [
-        {"role": "system", "content": "你是严格遵循结构化输出的编程教练。"},
-        {"role": "user", "content": coach_prompt},
-    ]
+    return [_COACH_SYS, {"role": "user", "content": coach_prompt}]
 
 
 async def generate_plan_node(state: PlanState) -> PlanState:
@@ -66,9 +66,11 @@ async def generate_plan_node(state: PlanState) -> PlanState:
         data = await chat_json(_build_messages(topic, question), PLAN_SCHEMA_HINT)
         # 保证 node_id 存在且是 uuid
         nodes = data.get("nodes") or []
-        for n in nodes:
+        # 一次取够随机字节，按 16 字节切成 uuid4
+        blob = os.urandom(16 * len(nodes))
+        for i, n in enumerate(nodes):
             if not n.get("node_id"):
-                n["node_id"] = str(uuid.uuid4())
+                n["node_id"] = str(uuid.UUID(bytes=blob[i * 16 : (i + 1) * 16], version=4))
         return {"plan": {"outline": data.get("outline", ""), "nodes": nodes}}
     except LLMError:
         return {"plan": mock_plan(topic, question)}
@@ -1,15 +1,47 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any
 
 import httpx
+import orjson
 
 from . import db
 
 
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\n|\n```$")
+_JSON_TAIL_RE = re.compile(r"\{[\s\S]*\}$")
+
+# 进程内共享连接池：复用 TLS 连接 / HTTP2 多路复用；首次调用时创建，aclose 后下次再重建
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0),
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return _client
+
+
+_STRICT_JSON_SYS = {
+    "role": "system",
+    "content": "你必须只输出严格 JSON，不要输出 markdown code fence。若你要解释，请放进 JSON 字段中。",
+}
+
+
+@lru_cache(maxsize=16)
+def _schema_sys(json_schema_hint: str) -> dict[str, str]:
+    # hint 都是模块级常量，每种只拼一次
+    return {"role": "system", "content": f"JSON 结构提示：{json_schema_hint}"}
+
+
 class LLMError(RuntimeError):
     pass
 
@@ -38,7 +70,8 @@ async def chat_json(messages: list[dict[str, str]], json_schema_hint: str) -> di
     - 如果未配置 key：抛出 LLMError（上层可 fallback 到 mock）
     """
 
-    cfg = db.get_llm_config()
+    # 配置缓存未命中时会读 SQLite，放到线程里别阻塞事件循环
+    cfg = await asyncio.to_thread(db.get_llm_config)
     if not cfg.get("api_key"):
         raise LLMError("LLM API key 未配置")
 
@@ -49,31 +82,24 @@ async def chat_json(messages: list[dict[str, str]], json_schema_hint: str) -> di
     payload = {
         "model": cfg["model"],
         "temperature": float(cfg["temperature"]),
-        "messages": messages
-        + [
-            {
-                "role": "system",
-                "content": "你必须只输出严格 JSON，不要输出 markdown code fence。若你要解释，请放进 JSON 字段中。",
-            },
-            {"role": "system", "content": f"JSON 结构提示：{json_schema_hint}"},
-        ],
+        "messages": [*messages, _STRICT_JSON_SYS, _schema_sys(json_schema_hint)],
     }
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        if r.status_code >= 400:
-            raise LLMError(f"LLM 调用失败: {r.status_code} {r.text[:500]}")
-        data = r.json()
-        try:
-            content = data["choices"][0]["message"]["content"]
-        except Exception as e:
-            raise LLMError(f"LLM 返回结构异常: {e}")
+    r = await _get_client().post(url, headers=headers, json=payload)
+    if r.status_code >= 400:
+        preview = r.content[:500].decode("utf-8", "replace")
+        raise LLMError(f"LLM 调用失败: {r.status_code} {preview}")
+    data = orjson.loads(r.content)
+    try:
+        content = data["choices"][0]["message"]["content"]
+    except Exception as e:
+        raise LLMError(f"LLM 返回结构异常: {e}")
 
     # 容错：有些模型会夹带多余文本；尽量抽取第一个 JSON 对象
     content = content.strip()
     if content.startswith("```"):
-        content = re.sub(r"^```[a-zA-Z]*\n|\n```$", "", content).strip()
-    m = re.search(r"\{[\s\S]*\}$", content)
+        content = _FENCE_RE.sub("", content).strip()
+    m = _JSON_TAIL_RE.search(content)
     if not m:
         # 尝试截取第一个 { ... }
         start = content.find("{")
@@ -81,7 +107,13 @@ async def chat_json(messages: list[dict[str, str]], json_schema_hint: str) -> di
         if start != -1 and end != -1 and end > start:
             content = content[start : end + 1]
     try:
-        return json.loads(content)
+        return orjson.loads(content)
     except Exception as e:
         raise LLMError(f"JSON 解析失败: {e}; content={content[:500]}")
 
+
+async def aclose() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
@@ -1,15 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import AsyncIterator
 
+import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from . import db
 from .grader import grade_answer
 from .supabase_store import SupabaseStore
 from .langgraph_app import plan_graph
+from . import llm
 from .llm import get_llm_public_config
 from .models import (
     AskIn,
@@ -24,38 +31,59 @@ from .models import (
     SubmitAnswerIn,
     SubmitAnswerOut,
 )
-from .settings import settings
+from .settings import get_settings
 
 
-app = FastAPI(title="LLM Learning Coach", version="0.1.0")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[o.strip() for o in settings.cors_allow_origins.split(",")] if settings.cors_allow_origins else ["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
+logger = logging.getLogger(__name__)
 
 sb: SupabaseStore | None = None
 
 
-@app.on_event("startup")
-def _startup() -> None:
-    db.ensure_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     global sb
+    db.init_db()
+
+    # Supabase 共用一个长连接客户端；未配置也允许后端启动（Teacher 仍可用；图谱接口会报错）
+    http: httpx.AsyncClient | None = None
+    settings = get_settings()
+    if settings.supabase_url and settings.supabase_anon_key:
+        http = httpx.AsyncClient(
+            base_url=f"{settings.supabase_url.rstrip('/')}/rest/v1",
+            http2=True,
+            timeout=20,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40, keepalive_expiry=60.0),
+        )
+        sb = SupabaseStore(http)
+        await sb.warmup()
     try:
-        sb = SupabaseStore()
-    except Exception:
-        # Supabase 不可用也允许后端启动（Teacher 仍可用；图谱接口会报错）
+        yield
+    finally:
         sb = None
+        if http is not None:
+            await http.aclose()
+        await llm.aclose()
+        db.close_db()
+
 
+app = FastAPI(title="LLM Learning Coach", version="0.1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
-@app.on_event("shutdown")
-def _shutdown() -> None:
-    # Supabase store 为 HTTP，无需关闭
-    pass
+# "*" 走中间件的通配快速路径；浏览器本就拒绝 "*" + credentials，这种组合下不开启 credentials
+_cors_raw = get_settings().cors_allow_origins
+if not _cors_raw or _cors_raw.strip() == "*":
+    _cors_origins = ["*"]
+    _cors_credentials = False
+else:
+    _cors_origins = [o.strip() for o in _cors_raw.split(",") if o.strip()]
+    _cors_credentials = True
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=_cors_origins,
+    allow_credentials=_cors_credentials,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 
 @app.get("/health")
@@ -88,8 +116,9 @@ def create_session(user_id: str) -> SessionCreateOut:
 @app.get("/sessions", response_model=list[SessionListItem])
 def list_sessions(user_id: str) -> list[SessionListItem]:
     items = db.list_sessions(user_id)
+    # 行来自自家 SQLite 且类型已确定：model_construct 跳过逐行校验（FastAPI 对实例也不会再校验）
     return [
-        SessionListItem(
+        SessionListItem.model_construct(
             session_id=i["session_id"],
             title=i["title"],
             created_at=datetime.fromisoformat(i["created_at"]),
@@ -116,56 +145,63 @@ def get_plan(session_id: str, user_id: str) -> PlanGetOut:
 
 @app.post("/sessions/{session_id}/ask", response_model=AskOut)
 async def ask(session_id: str, body: AskIn) -> AskOut:
-    s = db.get_session(session_id)
+    # SQLite 是同步 IO：async 端点里统一丢到线程池，避免阻塞事件循环
+    s = await asyncio.to_thread(db.get_session, session_id)
     if not s:
         raise HTTPException(status_code=404, detail="session not found")
     if s["user_id"] != body.user_id:
         raise HTTPException(status_code=403, detail="forbidden")
 
-    question_id = str(uuid.uuid4())
-    qrow = db.insert_question(question_id, session_id, body.question, body.topic_hint)
-
     # 用 LangGraph 生成 plan（LLM or mock）
     result = await plan_graph.ainvoke({"topic": body.topic_hint, "question": body.question})
     plan = result["plan"]
     outline = str(plan.get("outline", ""))
     nodes = list(plan.get("nodes") or [])
 
-    # 持久化 & 重置解锁
-    db.upsert_plan(session_id, outline, nodes)
-    db.set_unlocked_order(session_id, 1 if nodes else 0)  # 生成后默认解锁第 1 个知识点
-
-    # 写入图谱存储（Supabase，可选）
-    if sb:
-        try:
-            sb.upsert_plan_concepts(user_id=body.user_id, nodes=nodes)
-        except Exception:
-            pass
+    # 持久化问题与 plan & 重置解锁（生成后默认解锁第 1 个知识点），一个事务内完成；
+    # 图谱写入（Supabase，可选）只依赖 nodes，与 SQLite 写入并发进行
+    question_id = str(uuid.uuid4())
+    written, sb_result = await asyncio.gather(
+        asyncio.to_thread(
+            db.write_ask_result,
+            session_id,
+            question_id,
+            body.question,
+            body.topic_hint,
+            outline,
+            nodes,
+            1 if nodes else 0,
+        ),
+        sb.upsert_plan_concepts(user_id=body.user_id, nodes=nodes) if sb else asyncio.sleep(0),
+        return_exceptions=True,
+    )
+    if isinstance(written, BaseException):
+        raise written
+    if isinstance(sb_result, Exception):
+        logger.warning("supabase upsert_plan_concepts failed: %s", sb_result)
 
-    s2 = db.get_session(session_id) or s
     return AskOut(
         session_id=session_id,
         question_id=question_id,
-        created_at=datetime.fromisoformat(qrow["created_at"]),
+        created_at=datetime.fromisoformat(written["created_at"]),
         plan={"outline": outline, "nodes": nodes},
-        unlocked_order=int(s2.get("unlocked_order", 0)),
+        unlocked_order=written["unlocked_order"],
     )
 
 
 @app.post("/sessions/{session_id}/nodes/{node_id}/submit", response_model=SubmitAnswerOut)
 async def submit(session_id: str, node_id: str, body: SubmitAnswerIn) -> SubmitAnswerOut:
-    s = db.get_session(session_id)
+    s = await asyncio.to_thread(db.get_session, session_id)
     if not s:
         raise HTTPException(status_code=404, detail="session not found")
     if s["user_id"] != body.user_id:
         raise HTTPException(status_code=403, detail="forbidden")
 
-    plan = db.get_plan(session_id)
+    plan = await asyncio.to_thread(db.get_plan, session_id)
     if not plan:
         raise HTTPException(status_code=400, detail="no plan yet; call /ask first")
 
-    nodes = plan["nodes"]
-    node = next((n for n in nodes if str(n.get("node_id")) == node_id), None)
+    node = plan["node_index"].get(node_id)
     if not node:
         raise HTTPException(status_code=404, detail="node not found")
 
@@ -186,7 +222,8 @@ async def submit(session_id: str, node_id: str, body: SubmitAnswerIn) -> SubmitA
     )
 
     attempt_id = str(uuid.uuid4())
-    db.insert_attempt(
+    await asyncio.to_thread(
+        db.insert_attempt,
         attempt_id=attempt_id,
         session_id=session_id,
         user_id=body.user_id,
@@ -200,20 +237,17 @@ async def submit(session_id: str, node_id: str, body: SubmitAnswerIn) -> SubmitA
 
     new_unlocked = unlocked
     if grade["passed"]:
-        new_unlocked = max(unlocked, order + 1)
-        db.set_unlocked_order(session_id, new_unlocked)
+        # 并发提交时以库里的最新值为准（写入即返回，不再重读会话）
+        new_unlocked = await asyncio.to_thread(db.advance_unlocked_order, session_id, order + 1)
 
         # 图谱更新（可选）
         if sb:
             try:
-                sb.update_practice(body.user_id, str(node.get("title", "")), int(grade["score"]))
+                await sb.update_practice(body.user_id, str(node.get("title", "")), int(grade["score"]))
             except Exception:
                 pass
 
-    finished = False
-    if nodes:
-        max_order = max(int(n.get("order") or 0) for n in nodes)
-        finished = new_unlocked > max_order
+    finished = new_unlocked > plan["max_order"]
 
     return SubmitAnswerOut(
         node_id=node_id,
@@ -225,22 +259,23 @@ async def submit(session_id: str, node_id: str, body: SubmitAnswerIn) -> SubmitA
 
 
 @app.get("/graph", response_model=GraphOut)
-def get_graph(user_id: str) -> GraphOut:
+async def get_graph(user_id: str) -> ORJSONResponse:
     if not sb:
         raise HTTPException(status_code=503, detail="supabase not available")
     try:
-        data = sb.get_graph(user_id)
-        return GraphOut(nodes=data["nodes"], edges=data["edges"])
+        data = await sb.get_graph(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"supabase error: {e}")
+    # 数据由 SupabaseStore 自己组装：跳过 GraphOut 的逐行校验，直接交给 orjson 输出（response_model 仍用于文档）
+    return ORJSONResponse({"nodes": data["nodes"], "edges": data["edges"]})
 
 
 @app.post("/graph/upload")
-def upload_graph(body: GraphUploadIn) -> dict[str, str]:
+async def upload_graph(body: GraphUploadIn) -> dict[str, str]:
     if not sb:
         raise HTTPException(status_code=503, detail="supabase not available")
     try:
-        sb.upload_graph(body.user_id, body.nodes, body.edges)
+        await sb.upload_graph(body.user_id, body.nodes, body.edges)
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"supabase error: {e}")
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -31,5 +33,8 @@ class Settings(BaseSettings):
     supabase_schema: str = "public"
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    # 进程内唯一实例；各处都经由 get_settings() 取用，测试可 cache_clear() 后重新读取环境
+    return Settings()
 
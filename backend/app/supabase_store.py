@@ -1,32 +1,51 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import math
+import time
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Literal
 
 import httpx
+import orjson
 
-from .settings import settings
+from .settings import get_settings
 
 
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def _brightness_from_time(last: datetime | None) -> float:
-    # 与前端星空一致：指数衰减 + 底亮度
-    if not last:
+@lru_cache(maxsize=2048)
+def _iso_to_ts(s: str) -> float:
+    # last_seen_at 常批量取同一时刻（同一次 upsert），解析结果按原串缓存
+    dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return dt.timestamp() if dt.tzinfo else dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _brightness_fast(last_iso: str | None, now_ts: float) -> float:
+    # 与前端星空一致：指数衰减（30 天）+ 底亮度；直接用时间戳相减，不构造 timedelta
+    if not last_iso:
         return 0.12
-    if last.tzinfo is None:
-        last = last.replace(tzinfo=timezone.utc)
-    days = max(0.0, (_utcnow() - last.astimezone(timezone.utc)).total_seconds() / 86400.0)
-    b = math.exp(-days / 30.0)
-    return float(max(0.08, min(1.0, b)))
+    try:
+        ts = _iso_to_ts(last_iso)
+    except Exception:
+        return 0.12
+    return max(0.08, min(1.0, math.exp(-max(0.0, now_ts - ts) / 2592000.0)))
 
 
+@lru_cache(maxsize=8192)
 def _stable_id(name: str) -> str:
-    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+    # 仅作稳定 ID，不涉及安全
+    return hashlib.sha1(name.encode("utf-8"), usedforsecurity=False).hexdigest()[:16]
+
+
+def _check(resp: httpx.Response) -> None:
+    # 只比较状态码；出错时才读响应体拼错误信息
+    if resp.status_code >= 300:
+        raise RuntimeError(f"{resp.status_code} {resp.text[:500]}")
 
 
 class SupabaseStore:
@@ -35,11 +54,13 @@ class SupabaseStore:
     需要在 Supabase 中创建表（见 /supabase/schema.sql）。
     """
 
-    def __init__(self) -> None:
+    def __init__(self, http: httpx.AsyncClient) -> None:
+        settings = get_settings()
         if not settings.supabase_url or not settings.supabase_anon_key:
             raise RuntimeError("Supabase 未配置：请设置 APP_SUPABASE_URL / APP_SUPABASE_ANON_KEY")
 
-        self._base = settings.supabase_url.rstrip("/")
+        # http 由 main.lifespan 创建（base_url 已指向 /rest/v1），整个进程复用
+        self._http = http
         self._key = settings.supabase_anon_key
         self._schema = settings.supabase_schema or "public"
 
@@ -49,162 +70,148 @@ class SupabaseStore:
             "Content-Type": "application/json",
         }
 
-    def _rest(self, path: str) -> str:
-        return f"{self._base}/rest/v1{path}"
-
-    def upsert_plan_concepts(self, user_id: str, nodes: list[dict[str, Any]]) -> None:
-        concepts = []
+    async def warmup(self) -> None:
+        # 启动时先把连接（TCP + TLS）建好，首个请求不必再付握手延迟；短超时，失败不影响启动
+        try:
+            await self._http.head("/", headers=self._headers, timeout=2.0)
+        except httpx.HTTPError:
+            pass
+
+    async def _upsert(self, path: str, rows: list[dict[str, Any]]) -> None:
+        if not rows:
+            return
+        resp = await self._http.post(
+            path,
+            headers={**self._headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+            content=orjson.dumps(rows, option=orjson.OPT_UTC_Z),
+        )
+        _check(resp)
+
+    async def upsert_plan_concepts(self, user_id: str, nodes: list[dict[str, Any]]) -> None:
+        # 同一次 upsert 的所有行共用一个时间戳（datetime 由 orjson 直接序列化）
+        now = _utcnow()
+        # 同名知识点只保留最后一次（同一批 upsert 里主键重复 PostgREST 会报错）
+        concepts_by_id: dict[str, dict[str, Any]] = {}
+        edges_by_key: dict[tuple[str, str], dict[str, Any]] = {}
+        prev_cid: str | None = None
+        # 一次遍历同时产出知识点与边：默认按顺序串联 prereq
         for n in nodes:
             title = str(n.get("title") or n.get("name") or "").strip()
             if not title:
                 continue
-            concepts.append(
-                {
+            cid = _stable_id(title)
+            concepts_by_id[cid] = {
+                "user_id": user_id,
+                "concept_id": cid,
+                "name": title,
+                "level": int(n.get("order") or n.get("level") or 0),
+                "last_seen_at": now,
+                "updated_at": now,
+            }
+            if prev_cid is not None and prev_cid != cid:
+                edges_by_key[(prev_cid, cid)] = {
                     "user_id": user_id,
-                    "concept_id": _stable_id(title),
-                    "name": title,
-                    "level": int(n.get("order") or n.get("level") or 0),
-                    "last_seen_at": _utcnow().isoformat(),
-                    "updated_at": _utcnow().isoformat(),
+                    "source_id": prev_cid,
+                    "target_id": cid,
+                    "type": "PREREQ",
+                    "updated_at": now,
                 }
-            )
-
-        edges = []
-        # 默认按顺序串联 prereq
-        for a, b in zip(concepts, concepts[1:]):
-            edges.append(
+            prev_cid = cid
+        concepts = list(concepts_by_id.values())
+        edges = list(edges_by_key.values())
+
+        # 两张表的 upsert 互不依赖：并发发出
+        await asyncio.gather(
+            self._upsert("/user_concepts?on_conflict=user_id,concept_id", concepts),
+            self._upsert("/user_edges?on_conflict=user_id,source_id,target_id,type", edges),
+        )
+
+    async def update_practice(self, user_id: str, concept_title: str, score: int) -> None:
+        # mastery_score：简单 EMA，读改写在 update_mastery()（见 /supabase/schema.sql）里一次完成
+        resp = await self._http.post(
+            "/rpc/update_mastery",
+            headers=self._headers,
+            content=orjson.dumps(
                 {
-                    "user_id": user_id,
-                    "source_id": a["concept_id"],
-                    "target_id": b["concept_id"],
-                    "type": "PREREQ",
-                    "updated_at": _utcnow().isoformat(),
+                    "p_user_id": user_id,
+                    "p_concept_id": _stable_id(concept_title),
+                    "p_name": concept_title,
+                    "p_score": float(score) / 100.0,
                 }
-            )
-
-        with httpx.Client(timeout=20) as c:
-            if concepts:
-                c.post(
-                    self._rest("/user_concepts?on_conflict=user_id,concept_id"),
-                    headers={**self._headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
-                    json=concepts,
-                ).raise_for_status()
-            if edges:
-                c.post(
-                    self._rest("/user_edges?on_conflict=user_id,source_id,target_id,type"),
-                    headers={**self._headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
-                    json=edges,
-                ).raise_for_status()
-
-    def update_practice(self, user_id: str, concept_title: str, score: int) -> None:
-        cid = _stable_id(concept_title)
-        # mastery_score：简单 EMA
-        with httpx.Client(timeout=20) as c:
-            # 先读旧 mastery_score
-            r = c.get(
-                self._rest(f"/user_concepts?user_id=eq.{user_id}&concept_id=eq.{cid}&select=mastery_score"),
-                headers=self._headers,
-            )
-            r.raise_for_status()
-            rows = r.json()
-            old = float(rows[0]["mastery_score"]) if rows and rows[0].get("mastery_score") is not None else 0.0
-            new = old * 0.7 + (float(score) / 100.0) * 0.3
+            ),
+        )
+        _check(resp)
 
-            payload = {
-                "user_id": user_id,
-                "concept_id": cid,
-                "name": concept_title,
-                "last_practice_at": _utcnow().isoformat(),
-                "mastery_score": new,
-                "updated_at": _utcnow().isoformat(),
-            }
-            c.post(
-                self._rest("/user_concepts?on_conflict=user_id,concept_id"),
-                headers={**self._headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
-                json=[payload],
-            ).raise_for_status()
-
-    def upload_graph(self, user_id: str, nodes: list[dict[str, Any]], edges: list[dict[str, Any]]) -> None:
-        concepts = []
+    async def upload_graph(self, user_id: str, nodes: list[dict[str, Any]], edges: list[dict[str, Any]]) -> None:
+        now = _utcnow()
+        concepts_by_id: dict[str, dict[str, Any]] = {}
         for n in nodes:
             name = str(n.get("name") or n.get("title") or "").strip()
             if not name:
                 continue
-            concepts.append(
-                {
-                    "user_id": user_id,
-                    "concept_id": _stable_id(name),
-                    "name": name,
-                    "level": int(n.get("level") or 0),
-                    "last_seen_at": _utcnow().isoformat(),
-                    "updated_at": _utcnow().isoformat(),
-                }
-            )
+            cid = _stable_id(name)
+            concepts_by_id[cid] = {
+                "user_id": user_id,
+                "concept_id": cid,
+                "name": name,
+                "level": int(n.get("level") or 0),
+                "last_seen_at": now,
+                "updated_at": now,
+            }
+        concepts = list(concepts_by_id.values())
 
-        rels = []
+        rels_by_key: dict[tuple[str, str, str], dict[str, Any]] = {}
         for e in edges:
             a = str(e.get("from") or e.get("source") or "").strip()
             b = str(e.get("to") or e.get("target") or "").strip()
             if not a or not b:
                 continue
             typ = str(e.get("type") or "PREREQ").upper()
-            rels.append(
-                {
-                    "user_id": user_id,
-                    "source_id": _stable_id(a),
-                    "target_id": _stable_id(b),
-                    "type": "PREREQ" if typ == "PREREQ" else "REL",
-                    "updated_at": _utcnow().isoformat(),
-                }
-            )
-
-        with httpx.Client(timeout=20) as c:
-            if concepts:
-                c.post(
-                    self._rest("/user_concepts?on_conflict=user_id,concept_id"),
-                    headers={**self._headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
-                    json=concepts,
-                ).raise_for_status()
-            if rels:
-                c.post(
-                    self._rest("/user_edges?on_conflict=user_id,source_id,target_id,type"),
-                    headers={**self._headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
-                    json=rels,
-                ).raise_for_status()
-
-    def get_graph(self, user_id: str) -> dict[str, Any]:
-        with httpx.Client(timeout=20) as c:
-            rn = c.get(
-                self._rest(f"/user_concepts?user_id=eq.{user_id}&select=concept_id,name,level,last_seen_at,last_practice_at,mastery_score"),
+            typ = "PREREQ" if typ == "PREREQ" else "REL"
+            key = (_stable_id(a), _stable_id(b), typ)
+            rels_by_key[key] = {
+                "user_id": user_id,
+                "source_id": key[0],
+                "target_id": key[1],
+                "type": typ,
+                "updated_at": now,
+            }
+        rels = list(rels_by_key.values())
+
+        # 两张表的 upsert 互不依赖：并发发出
+        await asyncio.gather(
+            self._upsert("/user_concepts?on_conflict=user_id,concept_id", concepts),
+            self._upsert("/user_edges?on_conflict=user_id,source_id,target_id,type", rels),
+        )
+
+    async def get_graph(self, user_id: str) -> dict[str, Any]:
+        # 两次读互不依赖：并发发出，耗时取两者最大值
+        rn, re = await asyncio.gather(
+            self._http.get(
+                f"/user_concepts?user_id=eq.{user_id}&select=concept_id,name,level,last_seen_at,last_practice_at,mastery_score",
                 headers=self._headers,
-            )
-            rn.raise_for_status()
-            re = c.get(
-                self._rest(f"/user_edges?user_id=eq.{user_id}&select=source_id,target_id,type"),
+            ),
+            self._http.get(
+                f"/user_edges?user_id=eq.{user_id}&select=source_id,target_id,type",
                 headers=self._headers,
-            )
-            re.raise_for_status()
-
-        nodes = []
-        for r in rn.json():
-            last = r.get("last_practice_at") or r.get("last_seen_at")
-            last_dt = None
-            if last:
-                try:
-                    last_dt = datetime.fromisoformat(last.replace("Z", "+00:00"))
-                except Exception:
-                    last_dt = None
-            nodes.append(
-                {
-                    "id": r["concept_id"],
-                    "name": r["name"],
-                    "level": r.get("level"),
-                    "brightness": _brightness_from_time(last_dt),
-                    "last_practice_at": r.get("last_practice_at"),
-                    "mastery_score": r.get("mastery_score"),
-                }
-            )
+            ),
+        )
+        _check(rn)
+        _check(re)
+
+        now_ts = time.time()
+        nodes = [
+            {
+                "id": r["concept_id"],
+                "name": r["name"],
+                "level": r.get("level"),
+                "brightness": _brightness_fast(r.get("last_practice_at") or r.get("last_seen_at"), now_ts),
+                "last_practice_at": r.get("last_practice_at"),
+                "mastery_score": r.get("mastery_score"),
+            }
+            for r in orjson.loads(rn.content)
+        ]
 
-        edges = [{"source": e["source_id"], "target": e["target_id"], "type": e["type"]} for e in re.json()]
+        edges = [{"source": e["source_id"], "target": e["target_id"], "type": e["type"]} for e in orjson.loads(re.content)]
         return {"nodes": nodes, "edges": edges}
 
@@ -22,6 +22,24 @@ create table if not exists public.user_edges (
   primary key (user_id, source_id, target_id, type)
 );
 
+-- 练习后更新掌握度：单条 upsert 内完成 EMA（旧值 0.7 + 本次 0.3），免去先读后写的往返与并发覆盖
+create or replace function public.update_mastery(
+  p_user_id text,
+  p_concept_id text,
+  p_name text,
+  p_score double precision
+) returns void
+language sql
+as $$
+  insert into public.user_concepts (user_id, concept_id, name, last_practice_at, mastery_score, updated_at)
+  values (p_user_id, p_concept_id, p_name, now(), p_score * 0.3, now())
+  on conflict (user_id, concept_id) do update set
+    name = excluded.name,
+    mastery_score = coalesce(public.user_concepts.mastery_score, 0) * 0.7 + p_score * 0.3,
+    last_practice_at = now(),
+    updated_at = now();
+$$;
+
 -- 允许匿名 key 访问（你现在给的是 publishable key）
 alter table public.user_concepts enable row level security;
 alter table public.user_edges enable row level security;